@@ -3,60 +3,191 @@ AI inference abstraction layer.
 
 Load order:
   1. ONNX Runtime  — load from ONNX_MODEL_PATH if the directory exists
-  2. Transformers  — PyTorch pipeline as fallback
+                     (int8 model_quantized.onnx preferred over FP32 model.onnx
+                     on VNNI CPUs, see ONNX_INT8); skipped when a CUDA GPU is
+                     available
+  2. Transformers  — PyTorch pipeline as fallback (on GPU in float16 by
+                     default when CUDA is available)
 
 Both backends expose the same interface so callers never need to know which one
 is running.  Import this module and call load_model() at startup; then call
 analyze_batch() for inference.
+
+INFERENCE_DTYPE=bfloat16 runs the PyTorch backend in bf16 on CPU; it only pays
+off on CPUs with native AVX-512-BF16/AMX (Intel Sapphire Rapids, AMD Zen 4 or
+newer) and falls back to float32 elsewhere.  Left unset, it means float16 on
+GPU and float32 on CPU; an explicit float32 is honoured on GPU too.
 """
+import hashlib
 import logging
 import os
-from typing import Dict, List
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
 
 logger = logging.getLogger(__name__)
 
-MODEL_NAME = "cardiffnlp/twitter-xlm-roberta-base-sentiment-multilingual"
+# Thread pools are sized when torch is first imported (inside load_model),
+# so the env vars must be set before that.  Cores are split between the
+# WEB_CONCURRENCY worker processes, each of which loads its own model.
+_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+INFERENCE_THREADS = int(
+    os.getenv("INFERENCE_THREADS", str(max(1, (os.cpu_count() or 1) // _WORKERS)))
+)
+os.environ.setdefault("OMP_NUM_THREADS", str(INFERENCE_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(INFERENCE_THREADS))
+
+# Empty = device default (float16 on GPU, float32 on CPU)
+INFERENCE_DTYPE = os.getenv("INFERENCE_DTYPE", "").lower()
+
+# Override with a smaller distilled checkpoint (e.g. an SST-2 fine-tuned
+# bert-tiny/MiniLM) to trade accuracy for speed; its labels must include
+# "negative" (case-insensitive).
+MODEL_NAME = os.getenv(
+    "MODEL_NAME", "cardiffnlp/twitter-xlm-roberta-base-sentiment-multilingual"
+)
 ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", "./sentiment_onnx")
+ONNX_QUANTIZED_FILE_NAME = "model_quantized.onnx"
+# The int8 model (uint8 activations, int8 weights) can saturate and lose
+# accuracy without VNNI (AVX512-VNNI / AVX-VNNI: Ice Lake, Zen 4 or newer).
+# auto = use it only when /proc/cpuinfo reports VNNI; 1 = always; 0 = never.
+ONNX_INT8 = os.getenv("ONNX_INT8", "auto").lower()
+
+# HF pipelines run one forward pass per item unless batch_size is given
+INFERENCE_BATCH_SIZE = 32
+# 512 tokens never need more than this many characters; slicing first keeps the
+# tokenizer from walking multi-KB forwards only to truncate them
+MAX_TEXT_CHARS = 2000
+
+# Chats repeat greetings, stickers and forwards — remember (label, score) per text.
+# Keyed by a blake2b digest so private message text is not retained in memory.
+RESULT_CACHE_SIZE = 8192
 
 _pipeline = None
 _backend: str = "unavailable"
 
+_result_cache: "OrderedDict[bytes, Tuple[str, float]]" = OrderedDict()
+_result_cache_lock = threading.Lock()
+_cache_hits = 0
+_cache_misses = 0
+
+
+def _cpu_has_vnni() -> bool:
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_vnni" in flags or "avx_vnni" in flags
+
+
+def _use_int8_onnx() -> bool:
+    if not os.path.isfile(os.path.join(ONNX_MODEL_PATH, ONNX_QUANTIZED_FILE_NAME)):
+        return False
+    if ONNX_INT8 == "auto":
+        if _cpu_has_vnni():
+            return True
+        logger.info("CPU has no VNNI — using the FP32 ONNX model (set ONNX_INT8=1 to force int8)")
+        return False
+    return ONNX_INT8 in ("1", "true", "yes")
+
+
+def _cuda_available() -> bool:
+    try:
+        import torch
+        return torch.cuda.is_available()
+    except Exception:
+        return False
+
+
+def _resolve_torch_dtype(torch, on_gpu: bool):
+    """Map INFERENCE_DTYPE to a torch dtype the current device can run natively."""
+    if on_gpu:
+        if INFERENCE_DTYPE in ("", "float16"):
+            return torch.float16
+        if INFERENCE_DTYPE == "bfloat16":
+            return torch.bfloat16
+        if INFERENCE_DTYPE != "float32":
+            logger.warning("Unknown INFERENCE_DTYPE=%s — using float32", INFERENCE_DTYPE)
+        return torch.float32
+    if INFERENCE_DTYPE == "bfloat16":
+        if torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported():
+            return torch.bfloat16
+        logger.warning("CPU has no native bf16 support — using float32")
+    elif INFERENCE_DTYPE == "float16":
+        logger.warning("float16 is only used on GPU — using float32")
+    elif INFERENCE_DTYPE not in ("", "float32"):
+        logger.warning("Unknown INFERENCE_DTYPE=%s — using float32", INFERENCE_DTYPE)
+    return torch.float32
+
 
 def load_model() -> bool:
     """Try ONNX first, fall back to transformers.  Returns True if any backend loaded."""
     global _pipeline, _backend
 
+    on_gpu = _cuda_available()
+
     # ── Attempt 1: ONNX Runtime ───────────────────────────────────────────────
-    if os.path.isdir(ONNX_MODEL_PATH):
+    if os.path.isdir(ONNX_MODEL_PATH) and not on_gpu:
         try:
+            import onnxruntime as ort
             from optimum.onnxruntime import ORTModelForSequenceClassification
             from transformers import AutoTokenizer, pipeline as hf_pipeline
 
+            # ONNX Runtime ignores OMP/MKL env vars and defaults to one thread per core
+            session_options = ort.SessionOptions()
+            session_options.intra_op_num_threads = INFERENCE_THREADS
+            session_options.inter_op_num_threads = 1
+
+            quantized = _use_int8_onnx()
             logger.info("Loading ONNX model from %s …", ONNX_MODEL_PATH)
-            model = ORTModelForSequenceClassification.from_pretrained(ONNX_MODEL_PATH)
+            model = ORTModelForSequenceClassification.from_pretrained(
+                ONNX_MODEL_PATH,
+                file_name=ONNX_QUANTIZED_FILE_NAME if quantized else None,
+                provider="CPUExecutionProvider",
+                session_options=session_options,
+            )
             tokenizer = AutoTokenizer.from_pretrained(ONNX_MODEL_PATH)
             _pipeline = hf_pipeline(
                 "text-classification",
                 model=model,
                 tokenizer=tokenizer,
             )
-            _backend = "onnx"
-            logger.info("AI model ready  [backend=ONNX, path=%s]", ONNX_MODEL_PATH)
+            _backend = "onnx-int8" if quantized else "onnx"
+            logger.info(
+                "AI model ready  [backend=%s, path=%s, threads=%d]",
+                _backend, ONNX_MODEL_PATH, INFERENCE_THREADS,
+            )
             return True
         except Exception as exc:
             logger.warning("ONNX load failed — falling back to transformers: %s", exc)
 
     # ── Attempt 2: transformers + PyTorch ─────────────────────────────────────
     try:
+        import torch
         from transformers import pipeline as hf_pipeline
 
-        logger.info("Loading transformers model %s …", MODEL_NAME)
+        torch.set_num_threads(INFERENCE_THREADS)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # already fixed once any inter-op work has run
+
+        dtype = _resolve_torch_dtype(torch, on_gpu)
+        logger.info(
+            "Loading transformers model %s [device=%s, dtype=%s] …",
+            MODEL_NAME, "cuda:0" if on_gpu else "cpu", dtype,
+        )
         _pipeline = hf_pipeline(
             "sentiment-analysis",
             model=MODEL_NAME,
+            device=0 if on_gpu else -1,
+            dtype=dtype,
+        )
+        _backend = "transformers-cuda" if on_gpu else "transformers"
+        logger.info(
+            "AI model ready  [backend=%s (PyTorch), threads=%d]", _backend, INFERENCE_THREADS
         )
-        _backend = "transformers"
-        logger.info("AI model ready  [backend=transformers (PyTorch)]")
         return True
     except Exception as exc:
         logger.error("All model loading attempts failed: %s", exc)
@@ -72,12 +203,65 @@ def get_backend() -> str:
     return _backend
 
 
+def _cache_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def get_cache_stats() -> Dict[str, int]:
+    with _result_cache_lock:
+        return {"size": len(_result_cache), "hits": _cache_hits, "misses": _cache_misses}
+
+
 def analyze_batch(texts: List[str]) -> List[Dict]:
-    """Run *texts* through the loaded pipeline.  Raises if model is not loaded."""
+    """Run *texts* through the loaded pipeline.  Raises if model is not loaded.
+
+    Texts already seen are answered from an LRU cache; the rest are fed to the
+    model sorted by length so each batch pads to a similar sequence length.
+    Results are returned in the original order.
+    """
+    global _cache_hits, _cache_misses
     if _pipeline is None:
         raise ValueError("AI model is not loaded — call load_model() at startup.")
+
+    ordered: List[Dict] = [{}] * len(texts)
+    pending: Dict[bytes, List[int]] = {}
+    pending_texts: Dict[bytes, str] = {}
+    with _result_cache_lock:
+        for pos, text in enumerate(texts):
+            text = text[:MAX_TEXT_CHARS]
+            key = _cache_key(text)
+            cached = _result_cache.get(key)
+            if cached is not None:
+                _result_cache.move_to_end(key)
+                ordered[pos] = {"label": cached[0], "score": cached[1]}
+                _cache_hits += 1
+            else:
+                pending.setdefault(key, []).append(pos)
+                pending_texts[key] = text
+        # Each unique text is inferred once, however often it repeats in the batch
+        _cache_misses += len(pending)
+
+    if not pending:
+        return ordered
+
+    unique = sorted(pending, key=lambda k: len(pending_texts[k]))
     try:
-        return _pipeline(texts, truncation=True, max_length=512)
+        results = _pipeline(
+            [pending_texts[k] for k in unique],
+            batch_size=INFERENCE_BATCH_SIZE,
+            truncation=True,
+            max_length=512,
+        )
     except Exception as exc:
         logger.error("Batch inference failed: %s", exc)
         raise
+
+    with _result_cache_lock:
+        for key, result in zip(unique, results):
+            for pos in pending[key]:
+                ordered[pos] = result
+            _result_cache[key] = (result.get("label", ""), float(result.get("score", 0.0)))
+            _result_cache.move_to_end(key)
+        while len(_result_cache) > RESULT_CACHE_SIZE:
+            _result_cache.popitem(last=False)
+    return ordered
@@ -6,9 +6,15 @@ Run ONCE before starting the server on any new deployment:
     python export_model.py
 
 The exported model is saved to ./sentiment_onnx/ (or ONNX_MODEL_PATH env var).
+Set MODEL_NAME to export a different checkpoint; use a separate ONNX_MODEL_PATH
+per model so both can coexist.
 On subsequent starts ai_inference.py loads it automatically — no PyTorch needed
 at runtime, memory footprint drops ~4×, inference is ~2× faster.
 
+After export the model is also dynamically quantized to int8
+(model_quantized.onnx); re-running the script on an existing FP32 export adds
+just the int8 file.  ai_inference.py uses it on CPUs with VNNI (see ONNX_INT8).
+
 Requirements:
     pip install optimum[onnxruntime] onnxruntime
 """
@@ -19,8 +25,11 @@ import sys
 logging.basicConfig(level=logging.INFO, format="%(levelname)s  %(message)s")
 logger = logging.getLogger(__name__)
 
-MODEL_NAME = "cardiffnlp/twitter-xlm-roberta-base-sentiment-multilingual"
+MODEL_NAME = os.getenv(
+    "MODEL_NAME", "cardiffnlp/twitter-xlm-roberta-base-sentiment-multilingual"
+)
 SAVE_PATH = os.getenv("ONNX_MODEL_PATH", "./sentiment_onnx")
+QUANTIZED_FILE_NAME = "model_quantized.onnx"
 
 
 def main() -> int:
@@ -34,28 +43,61 @@ def main() -> int:
         )
         return 1
 
-    if os.path.isdir(SAVE_PATH) and os.listdir(SAVE_PATH):
-        logger.info("ONNX model already present at %s — skipping export.", SAVE_PATH)
+    fp32_path = os.path.join(SAVE_PATH, "model.onnx")
+    int8_path = os.path.join(SAVE_PATH, QUANTIZED_FILE_NAME)
+
+    if os.path.isfile(int8_path):
+        logger.info("int8 ONNX model already present at %s — skipping export.", int8_path)
+        logger.info("Delete the directory to force a re-export.")
+        return 0
+
+    if os.path.isfile(fp32_path):
+        # Deployments exported before quantization was added: only add the int8 file
+        logger.info("FP32 ONNX model found at %s — quantizing it only.", fp32_path)
+        try:
+            model = ORTModelForSequenceClassification.from_pretrained(SAVE_PATH)
+            tokenizer = AutoTokenizer.from_pretrained(SAVE_PATH)
+        except Exception as exc:
+            logger.error("Loading existing ONNX model failed: %s", exc)
+            return 1
+    elif os.path.isdir(SAVE_PATH) and os.listdir(SAVE_PATH):
+        logger.info("%s is not empty but has no model.onnx — skipping export.", SAVE_PATH)
         logger.info("Delete the directory to force a re-export.")
         return 0
+    else:
+        logger.info("Exporting %s to ONNX …", MODEL_NAME)
+        logger.info("This downloads ~500 MB on first run.")
 
-    logger.info("Exporting %s to ONNX …", MODEL_NAME)
-    logger.info("This downloads ~500 MB on first run.")
+        try:
+            model = ORTModelForSequenceClassification.from_pretrained(
+                MODEL_NAME,
+                export=True,
+            )
+            tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+        except Exception as exc:
+            logger.error("Export failed: %s", exc)
+            return 1
 
+        os.makedirs(SAVE_PATH, exist_ok=True)
+        model.save_pretrained(SAVE_PATH)
+        tokenizer.save_pretrained(SAVE_PATH)
+        logger.info("Saved to %s", SAVE_PATH)
+
+    # Dynamic int8 quantization — weights shrink ~4×, int8 GEMMs use VNNI
+    logger.info("Quantizing to int8 …")
     try:
+        from optimum.onnxruntime import ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        quantizer = ORTQuantizer.from_pretrained(model)
+        qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+        quantizer.quantize(save_dir=SAVE_PATH, quantization_config=qconfig)
         model = ORTModelForSequenceClassification.from_pretrained(
-            MODEL_NAME,
-            export=True,
+            SAVE_PATH, file_name=QUANTIZED_FILE_NAME
         )
-        tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+        logger.info("Saved int8 model to %s/%s", SAVE_PATH, QUANTIZED_FILE_NAME)
     except Exception as exc:
-        logger.error("Export failed: %s", exc)
-        return 1
-
-    os.makedirs(SAVE_PATH, exist_ok=True)
-    model.save_pretrained(SAVE_PATH)
-    tokenizer.save_pretrained(SAVE_PATH)
-    logger.info("Saved to %s", SAVE_PATH)
+        logger.warning("Quantization failed — the FP32 ONNX model will be used: %s", exc)
 
     # Smoke-test the exported model
     logger.info("Running smoke test …")
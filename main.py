@@ -1,5 +1,6 @@
 from fastapi import FastAPI, Depends, HTTPException, Header, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import asyncio
 import hashlib
 import os
@@ -67,7 +68,16 @@ if not DATABASE_URL:
 # ─────────────────────────────────────────────────────────────────────────────
 # 1. Database
 # ─────────────────────────────────────────────────────────────────────────────
-database = Database(DATABASE_URL)
+if "postgresql" in DATABASE_URL.lower():
+    # Warm asyncpg pool per worker; statement cache keeps constant queries prepared
+    database = Database(
+        DATABASE_URL,
+        min_size=int(os.getenv("DB_POOL_MIN_SIZE", "5")),
+        max_size=int(os.getenv("DB_POOL_MAX_SIZE", "20")),
+        statement_cache_size=1024,
+    )
+else:
+    database = Database(DATABASE_URL)
 metadata = MetaData()
 
 sessions = Table(
@@ -111,6 +121,24 @@ analyses_table = Table(
 engine = create_engine(DATABASE_URL)
 metadata.create_all(engine)
 
+# Hot-path statements as constant SQL text: built once, and asyncpg's
+# per-connection prepared-statement cache hits on the unchanged query string.
+SELECT_SESSION_BY_PHONE = (
+    "SELECT id, phone, api_id, api_hash, session_string "
+    "FROM sessions WHERE phone = :phone"
+)
+UPDATE_SESSION_CREDENTIALS = (
+    "UPDATE sessions SET api_id = :api_id, api_hash = :api_hash, "
+    "session_string = :session_string WHERE phone = :phone"
+)
+INSERT_SESSION = (
+    "INSERT INTO sessions (phone, api_id, api_hash, session_string) "
+    "VALUES (:phone, :api_id, :api_hash, :session_string)"
+)
+UPDATE_SESSION_STRING = (
+    "UPDATE sessions SET session_string = :session_string WHERE phone = :phone"
+)
+
 # ─────────────────────────────────────────────────────────────────────────────
 # 2. Global state
 # ─────────────────────────────────────────────────────────────────────────────
@@ -118,6 +146,12 @@ metadata.create_all(engine)
 MAX_ACTIVE_CLIENTS = 200
 active_clients: OrderedDict[str, TelegramClient] = OrderedDict()
 active_clients_lock = asyncio.Lock()
+# Per-phone locks so concurrent requests build at most one client per phone.
+# "users" counts holders + waiters; the last one out removes the entry.
+client_creation_locks: Dict[str, Dict[str, Any]] = {}
+# get_me() round-trip is skipped for clients verified within this window
+CLIENT_HEALTH_CHECK_INTERVAL = 60
+client_checked_at: Dict[str, float] = {}
 
 analysis_cache: Dict[str, Dict[str, Any]] = {}
 cache_lock = asyncio.Lock()
@@ -128,6 +162,15 @@ MAX_JOBS = 1000
 job_store: Dict[str, Dict[str, Any]] = {}
 job_store_lock = asyncio.Lock()
 
+# /login clients — kept connected until /verify so sign-in skips a new handshake
+PENDING_LOGIN_TTL = 300
+MAX_PENDING_LOGINS = 200
+# Expired pending clients are disconnected by a background sweep — the
+# follow-up request may land on another worker and never reach this one
+PENDING_SWEEP_INTERVAL = 60
+pending_login_clients: Dict[str, Dict[str, Any]] = {}
+pending_login_lock = asyncio.Lock()
+
 # 2FA pending clients — kept alive for up to 5 min while user enters password
 PENDING_2FA_TTL = 300
 pending_2fa_clients: Dict[str, Dict[str, Any]] = {}
@@ -182,7 +225,11 @@ def load_negative_words(file_path: str = "data/uz_negative_words.txt") -> List[s
             logger.warning("Negativ so'zlar fayli topilmadi: %s", file_path)
             return []
         with open(file_path, "r", encoding="utf-8") as f:
-            words = [line.strip().lower() for line in f if line.strip()]
+            # "--- Section ---" lines are category headings, not keywords
+            words = list(dict.fromkeys(
+                w for w in (line.strip().lower() for line in f)
+                if w and not w.startswith("---")
+            ))
         logger.info("Loaded %d negative keywords", len(words))
         return words
     except Exception:
@@ -191,7 +238,7 @@ def load_negative_words(file_path: str = "data/uz_negative_words.txt") -> List[s
 
 
 NEGATIVE_KEYWORDS = load_negative_words()
-KEYWORD_PATTERNS: List[re.Pattern] = []
+KEYWORD_REGEX: Optional[re.Pattern] = None
 AI_NEGATIVE_SCORE_THRESHOLD = 0.85
 
 LEET_MAP = {
@@ -205,17 +252,27 @@ LEET_MAP = {
 SEPARATOR = r"[^\w]*"
 
 
-def build_keyword_pattern(keyword: str) -> re.Pattern:
+def _keyword_body(keyword: str) -> str:
     normalized = keyword.strip().lower()
     if len(normalized) <= 2:
-        return re.compile(rf"(?<!\w){re.escape(normalized)}(?!\w)", re.IGNORECASE)
+        return re.escape(normalized)
     parts = [LEET_MAP.get(ch, re.escape(ch)) for ch in normalized]
-    return re.compile(rf"(?<!\w){SEPARATOR.join(parts)}(?!\w)", re.IGNORECASE)
+    return SEPARATOR.join(parts)
+
+
+def build_keyword_regex(keywords: List[str]) -> Optional[re.Pattern]:
+    """Fold every keyword into one alternation so a message is scanned once,
+    not once per keyword.  Callers pass lowered text, so no IGNORECASE."""
+    bodies = [_keyword_body(k) for k in keywords if k.strip()]
+    if not bodies:
+        return None
+    return re.compile(rf"(?<!\w)(?:{'|'.join(bodies)})(?!\w)")
 
 
 def is_toxic_by_keywords(text: str) -> bool:
-    text_lower = text.lower()
-    return any(p.search(text_lower) for p in KEYWORD_PATTERNS)
+    if KEYWORD_REGEX is None:
+        return False
+    return KEYWORD_REGEX.search(text.lower()) is not None
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -225,7 +282,7 @@ def is_toxic_by_keywords(text: str) -> bool:
 async def lifespan(app: FastAPI):
     await database.connect()
 
-    global KEYWORD_PATTERNS
+    global KEYWORD_REGEX
 
     # ── AI model ──────────────────────────────────────────────────────────────
     logger.info("AI Model yuklanmoqda...")
@@ -234,8 +291,8 @@ async def lifespan(app: FastAPI):
     else:
         logger.warning("AI model yuklanmadi; faqat keyword tahlili ishlatiladi")
 
-    KEYWORD_PATTERNS = [build_keyword_pattern(k) for k in NEGATIVE_KEYWORDS]
-    logger.info("%d keyword pattern tayyor", len(KEYWORD_PATTERNS))
+    KEYWORD_REGEX = build_keyword_regex(NEGATIVE_KEYWORDS)
+    logger.info("%d keyword pattern tayyor", len(NEGATIVE_KEYWORDS))
 
     # ── Schema migration: add columns that older deployments may be missing ──────
     if "postgresql" in DATABASE_URL.lower():
@@ -367,9 +424,12 @@ async def lifespan(app: FastAPI):
     except Exception:
         logger.warning("Phone normalization migration failed — skipped", exc_info=True)
 
+    sweeper = asyncio.create_task(_pending_client_sweeper())
+
     yield
 
     # ── Shutdown ──────────────────────────────────────────────────────────────
+    sweeper.cancel()
     async with active_clients_lock:
         for phone, client in active_clients.items():
             try:
@@ -378,6 +438,14 @@ async def lifespan(app: FastAPI):
             except Exception as exc:
                 logger.warning("Error disconnecting %s: %s", mask_phone(phone), exc)
 
+    async with pending_login_lock:
+        for phone, entry in pending_login_clients.items():
+            try:
+                await entry["client"].disconnect()
+            except Exception:
+                pass
+        pending_login_clients.clear()
+
     async with pending_2fa_lock:
         for phone, entry in pending_2fa_clients.items():
             try:
@@ -392,7 +460,11 @@ async def lifespan(app: FastAPI):
 # ─────────────────────────────────────────────────────────────────────────────
 # 5. App
 # ─────────────────────────────────────────────────────────────────────────────
-app = FastAPI(title="Telegram Sentiment Backend", lifespan=lifespan)
+app = FastAPI(
+    title="Telegram Sentiment Backend",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 
 def get_allowed_origins() -> List[str]:
@@ -582,6 +654,11 @@ async def connect_with_retry(
     return False
 
 
+def _forget_client_state(phone: str) -> None:
+    """Drop per-phone bookkeeping once its client leaves active_clients."""
+    client_checked_at.pop(phone, None)
+
+
 async def _evict_lru_client_if_needed() -> None:
     """Evict the least-recently-used client when the pool is full."""
     async with active_clients_lock:
@@ -592,11 +669,52 @@ async def _evict_lru_client_if_needed() -> None:
             except Exception:
                 pass
             del active_clients[oldest_phone]
+            _forget_client_state(oldest_phone)
             logger.info("LRU evicted client for %s", mask_phone(oldest_phone))
 
 
+async def _purge_expired_pending_clients() -> None:
+    """Disconnect /login and 2FA clients whose follow-up never arrived."""
+    now = time.time()
+    for store, lock in (
+        (pending_login_clients, pending_login_lock),
+        (pending_2fa_clients, pending_2fa_lock),
+    ):
+        async with lock:
+            expired = [p for p, e in store.items() if e["expires_at"] < now]
+            entries = [store.pop(p) for p in expired]
+        for entry in entries:
+            try:
+                await entry["client"].disconnect()
+            except Exception:
+                pass
+
+
+async def _pending_client_sweeper() -> None:
+    while True:
+        await asyncio.sleep(PENDING_SWEEP_INTERVAL)
+        try:
+            await _purge_expired_pending_clients()
+        except Exception:
+            logger.warning("Pending client sweep failed", exc_info=True)
+
+
 async def get_client_session(phone: str) -> TelegramClient:
     """Return a healthy TelegramClient for *phone* (digits-only expected)."""
+    entry = client_creation_locks.get(phone)
+    if entry is None:
+        entry = client_creation_locks[phone] = {"lock": asyncio.Lock(), "users": 0}
+    entry["users"] += 1
+    try:
+        async with entry["lock"]:
+            return await _get_or_create_client(phone)
+    finally:
+        entry["users"] -= 1
+        if entry["users"] == 0 and client_creation_locks.get(phone) is entry:
+            del client_creation_locks[phone]
+
+
+async def _get_or_create_client(phone: str) -> TelegramClient:
     cached_client: Optional[TelegramClient] = None
     async with active_clients_lock:
         if phone in active_clients:
@@ -604,7 +722,16 @@ async def get_client_session(phone: str) -> TelegramClient:
             cached_client = active_clients[phone]
 
     if cached_client is not None:
+        # Recently verified and still connected — skip the get_me() round-trip.
+        # Operations let transport/auth errors reach execute_with_client_retry,
+        # which reconnects a stale link or drops a revoked session with a 401.
+        if (
+            cached_client.is_connected()
+            and time.time() - client_checked_at.get(phone, 0.0) < CLIENT_HEALTH_CHECK_INTERVAL
+        ):
+            return cached_client
         if await is_client_healthy(cached_client):
+            client_checked_at[phone] = time.time()
             return cached_client
         logger.warning("Cached client for %s is unhealthy, removing", mask_phone(phone))
         async with active_clients_lock:
@@ -614,9 +741,9 @@ async def get_client_session(phone: str) -> TelegramClient:
                 except Exception:
                     pass
                 active_clients.pop(phone, None)
+        _forget_client_state(phone)
 
-    query = sessions.select().where(sessions.c.phone == phone)
-    user = await database.fetch_one(query)
+    user = await database.fetch_one(SELECT_SESSION_BY_PHONE, values={"phone": phone})
     if not user:
         raise HTTPException(status_code=404, detail="Avval login qiling")
 
@@ -667,6 +794,7 @@ async def get_client_session(phone: str) -> TelegramClient:
     await _evict_lru_client_if_needed()
     async with active_clients_lock:
         active_clients[phone] = client
+    client_checked_at[phone] = time.time()
 
     logger.info("New client created for %s", mask_phone(phone))
     return client
@@ -742,28 +870,91 @@ async def get_db_cached_analysis(
         return None
 
 
+# Upsert SQL is constant text so asyncpg's statement cache reuses the prepared
+# plan; ON CONFLICT DO UPDATE avoids a separate try/except for duplicate keys.
+_MESSAGE_COLUMNS = (
+    "(phone, chat_id, message_id, sender_id, text, is_negative, reason, confidence, analyzed_at) "
+)
+_MESSAGE_UPSERT_TAIL = (
+    " ON CONFLICT (phone, chat_id, message_id) DO UPDATE SET "
+    "is_negative = TRUE, reason = EXCLUDED.reason, "
+    "confidence = EXCLUDED.confidence, analyzed_at = EXCLUDED.analyzed_at"
+)
+
+# PostgreSQL: the whole batch is bound as arrays and unnested server-side,
+# one statement per analysis whatever the row count.
+UPSERT_MESSAGES_UNNEST = (
+    "INSERT INTO messages " + _MESSAGE_COLUMNS +
+    "SELECT CAST(:phone AS TEXT), CAST(:chat_id AS BIGINT), m.message_id, m.sender_id, "
+    "m.text, TRUE, m.reason, m.confidence, CAST(:analyzed_at AS TEXT) "
+    "FROM unnest(CAST(:message_ids AS BIGINT[]), CAST(:sender_ids AS BIGINT[]), "
+    "CAST(:texts AS TEXT[]), CAST(:reasons AS TEXT[]), "
+    "CAST(:confidences AS DOUBLE PRECISION[])) "
+    "AS m(message_id, sender_id, text, reason, confidence)"
+    + _MESSAGE_UPSERT_TAIL
+)
+
+# Other backends: full chunks of PERSIST_CHUNK_SIZE rows share one multi-row
+# statement, the remainder goes through the single-row one.  5 params/row
+# keeps a chunk under SQLite's default 999-variable limit.
+PERSIST_CHUNK_SIZE = 100
+UPSERT_MESSAGE_ROW = (
+    "INSERT INTO messages " + _MESSAGE_COLUMNS +
+    "VALUES (:phone, :chat_id, :message_id, :sender_id, :text, TRUE, :reason, :confidence, :analyzed_at)"
+    + _MESSAGE_UPSERT_TAIL
+)
+UPSERT_MESSAGES_CHUNK = (
+    "INSERT INTO messages " + _MESSAGE_COLUMNS + "VALUES " + ", ".join(
+        f"(:phone, :chat_id, :message_id_{i}, :sender_id_{i}, :text_{i}, "
+        f"TRUE, :reason_{i}, :confidence_{i}, :analyzed_at)"
+        for i in range(PERSIST_CHUNK_SIZE)
+    ) + _MESSAGE_UPSERT_TAIL
+)
+
+
 async def persist_analysis(
     phone: str, chat_id: int, limit: int, result: "AnalyzeResponse"
 ) -> None:
     """Persist negative messages and analysis metadata to the database."""
     now = datetime.now(timezone.utc).isoformat()
     try:
-        for msg in result.negative_messages:
-            # ON CONFLICT DO UPDATE = upsert; avoids separate try/except for duplicate keys
+        msgs = result.negative_messages
+        if msgs and "postgresql" in DATABASE_URL.lower():
             await database.execute(
-                "INSERT INTO messages "
-                "(phone, chat_id, message_id, sender_id, text, is_negative, reason, confidence, analyzed_at) "
-                "VALUES (:phone, :chat_id, :message_id, :sender_id, :text, TRUE, :reason, :confidence, :analyzed_at) "
-                "ON CONFLICT (phone, chat_id, message_id) DO UPDATE SET "
-                "is_negative = TRUE, reason = EXCLUDED.reason, "
-                "confidence = EXCLUDED.confidence, analyzed_at = EXCLUDED.analyzed_at",
+                UPSERT_MESSAGES_UNNEST,
                 values={
-                    "phone": phone, "chat_id": chat_id, "message_id": msg.id,
-                    "sender_id": msg.sender_id, "text": msg.text,
-                    "reason": msg.reason.value, "confidence": msg.confidence,
-                    "analyzed_at": now,
+                    "phone": phone, "chat_id": chat_id, "analyzed_at": now,
+                    "message_ids": [m.id for m in msgs],
+                    "sender_ids": [m.sender_id for m in msgs],
+                    "texts": [m.text for m in msgs],
+                    "reasons": [m.reason.value for m in msgs],
+                    "confidences": [m.confidence for m in msgs],
                 },
             )
+        elif msgs:
+            full = len(msgs) - len(msgs) % PERSIST_CHUNK_SIZE
+            for start in range(0, full, PERSIST_CHUNK_SIZE):
+                values: Dict[str, Any] = {"phone": phone, "chat_id": chat_id, "analyzed_at": now}
+                for i, msg in enumerate(msgs[start:start + PERSIST_CHUNK_SIZE]):
+                    values[f"message_id_{i}"] = msg.id
+                    values[f"sender_id_{i}"] = msg.sender_id
+                    values[f"text_{i}"] = msg.text
+                    values[f"reason_{i}"] = msg.reason.value
+                    values[f"confidence_{i}"] = msg.confidence
+                await database.execute(UPSERT_MESSAGES_CHUNK, values=values)
+            if full < len(msgs):
+                await database.execute_many(
+                    UPSERT_MESSAGE_ROW,
+                    values=[
+                        {
+                            "phone": phone, "chat_id": chat_id, "analyzed_at": now,
+                            "message_id": msg.id, "sender_id": msg.sender_id,
+                            "text": msg.text, "reason": msg.reason.value,
+                            "confidence": msg.confidence,
+                        }
+                        for msg in msgs[full:]
+                    ],
+                )
         await database.execute(
             "INSERT INTO analyses (phone, chat_id, fetch_limit, analyzed_count, negative_count, completed_at) "
             "VALUES (:phone, :chat_id, :fetch_limit, :analyzed_count, :negative_count, :completed_at)",
@@ -785,6 +976,17 @@ _CONNECTION_ERRORS = (
     OSError,
 )
 
+# Errors an operation must let escape so execute_with_client_retry can
+# reconnect (transport) or drop the client with a 401 (auth). Other RPC
+# errors keep their endpoint-specific handling.
+_CLIENT_RETRY_ERRORS = (
+    errors.AuthKeyUnregisteredError,
+    errors.UserDeactivatedError,
+    ConnectionError,
+    asyncio.TimeoutError,
+    OSError,
+)
+
 
 async def execute_with_client_retry(client: TelegramClient, operation, phone: str, max_retries: int = 3):
     for attempt in range(max_retries):
@@ -794,6 +996,7 @@ async def execute_with_client_retry(client: TelegramClient, operation, phone: st
             logger.warning("Auth invalidated for %s: %s", mask_phone(phone), type(exc).__name__)
             async with active_clients_lock:
                 active_clients.pop(phone, None)
+            _forget_client_state(phone)
             raise HTTPException(
                 status_code=401,
                 detail="Telegram sessiyasi bekor qilindi. Qayta login qiling",
@@ -861,27 +1064,32 @@ def analyze_texts_batch(texts: List[str]):
 # ─────────────────────────────────────────────────────────────────────────────
 # 8. Core analysis logic (shared by sync endpoint and background job)
 # ─────────────────────────────────────────────────────────────────────────────
-async def _do_analyze(data: AnalyzeRequest, phone: str) -> AnalyzeResponse:
-    """Run the full analysis for *data.chat_id*. *phone* must be digits-only."""
+async def _do_analyze(data: AnalyzeRequest, phone: str) -> Dict[str, Any]:
+    """Run the full analysis for *data.chat_id*. *phone* must be digits-only.
+
+    Returns the AnalyzeResponse shape as a plain dict so cache hits are served
+    without re-validating every message through pydantic.
+    """
     cache_key = get_cache_key(phone, data.chat_id, data.limit)
 
     # L1: in-memory cache
     cached = await get_cached_analysis(cache_key)
     if cached is not None:
-        return AnalyzeResponse(**cached)
+        return cached
 
     # L2: persistent DB cache (survives restarts; shared across workers)
     db_cached = await get_db_cached_analysis(phone, data.chat_id, data.limit)
     if db_cached is not None:
         await set_cached_analysis(cache_key, db_cached)  # warm L1
-        return AnalyzeResponse(**db_cached)
+        return db_cached
 
     client = await get_client_session(phone)
 
     AI_BATCH_SIZE = 100
 
     async def _flush_ai_batch(
-        batch_msgs: list,
+        batch_ids: List[int],
+        batch_sender_ids: List[Optional[int]],
         batch_texts: List[str],
         negative_messages: List[NegativeMessage],
         negative_ids: Set[int],
@@ -890,8 +1098,10 @@ async def _do_analyze(data: AnalyzeRequest, phone: str) -> AnalyzeResponse:
             return
         try:
             results = await asyncio.to_thread(analyze_texts_batch, batch_texts)
-            for msg, result in zip(batch_msgs, results):
-                if msg.id not in negative_ids:
+            for msg_id, sender_id, text, result in zip(
+                batch_ids, batch_sender_ids, batch_texts, results
+            ):
+                if msg_id not in negative_ids:
                     score = float(result.get("score", 0.0))
                     if (
                         result.get("label", "").lower() == "negative"
@@ -899,26 +1109,33 @@ async def _do_analyze(data: AnalyzeRequest, phone: str) -> AnalyzeResponse:
                     ):
                         negative_messages.append(
                             NegativeMessage(
-                                id=msg.id,
-                                text=msg.text,
+                                id=msg_id,
+                                text=text,
                                 confidence=score,
-                                sender_id=msg.sender_id,
+                                sender_id=sender_id,
                                 reason=MessageReason.AI_SENTIMENT,
                             )
                         )
-                        negative_ids.add(msg.id)
+                        negative_ids.add(msg_id)
         except Exception:
             logger.exception("AI batch tahlilida xatolik")
 
     async def analyze_operation():
         negative_messages: List[NegativeMessage] = []
-        uncertain_msgs: list = []
+        # Only the fields inference needs are kept — not the Telethon Message objects
+        uncertain_ids: List[int] = []
+        uncertain_sender_ids: List[Optional[int]] = []
         uncertain_texts: List[str] = []
         negative_ids: Set[int] = set()
         analyzed_count = 0
+        # At most one AI batch runs in the background while the next one is fetched
+        inflight: Optional[asyncio.Task] = None
+        ai_enabled = ai_inference.is_available()
 
         try:
             entity = await client.get_entity(data.chat_id)
+        except _CLIENT_RETRY_ERRORS:
+            raise
         except Exception:
             logger.exception("Chat ID %s ga kira olmadi", data.chat_id)
             raise HTTPException(status_code=404, detail="Chat topilmadi yoki kira olmadi")
@@ -941,23 +1158,38 @@ async def _do_analyze(data: AnalyzeRequest, phone: str) -> AnalyzeResponse:
                             )
                         )
                         negative_ids.add(msg.id)
-                else:
-                    uncertain_msgs.append(msg)
+                elif ai_enabled:
+                    # Keyword hits above never reach the model
+                    uncertain_ids.append(msg.id)
+                    uncertain_sender_ids.append(msg.sender_id)
                     uncertain_texts.append(msg.text)
                     if len(uncertain_texts) >= AI_BATCH_SIZE:
-                        await _flush_ai_batch(
-                            uncertain_msgs, uncertain_texts, negative_messages, negative_ids
-                        )
-                        uncertain_msgs = []
+                        if inflight is not None:
+                            await inflight
+                        inflight = asyncio.create_task(_flush_ai_batch(
+                            uncertain_ids, uncertain_sender_ids, uncertain_texts,
+                            negative_messages, negative_ids,
+                        ))
+                        uncertain_ids = []
+                        uncertain_sender_ids = []
                         uncertain_texts = []
-        except HTTPException:
+            if inflight is not None:
+                await inflight
+                inflight = None
+        except (HTTPException, *_CLIENT_RETRY_ERRORS):
             raise
         except Exception:
             logger.exception("Xabarlarni olishda xatolik")
             raise HTTPException(status_code=500, detail="Xabarlarni olishda xatolik yuz berdi")
+        finally:
+            if inflight is not None:
+                inflight.cancel()
 
         if uncertain_texts:
-            await _flush_ai_batch(uncertain_msgs, uncertain_texts, negative_messages, negative_ids)
+            await _flush_ai_batch(
+                uncertain_ids, uncertain_sender_ids, uncertain_texts,
+                negative_messages, negative_ids,
+            )
 
         return AnalyzeResponse(
             analyzed_count=analyzed_count,
@@ -967,14 +1199,10 @@ async def _do_analyze(data: AnalyzeRequest, phone: str) -> AnalyzeResponse:
 
     result = await execute_with_client_retry(client, analyze_operation, phone)
 
-    cache_data = {
-        "analyzed_count": result.analyzed_count,
-        "negative_count": result.negative_count,
-        "negative_messages": [m.model_dump() for m in result.negative_messages],
-    }
+    cache_data = result.model_dump(mode="json")
     await set_cached_analysis(cache_key, cache_data)
     await persist_analysis(phone, data.chat_id, data.limit, result)
-    return result
+    return cache_data
 
 
 async def _run_analysis_job(job_id: str, data: AnalyzeRequest, phone: str) -> None:
@@ -986,7 +1214,7 @@ async def _run_analysis_job(job_id: str, data: AnalyzeRequest, phone: str) -> No
         async with job_store_lock:
             job_store[job_id] = {
                 "status": "done",
-                "result": result.model_dump(),
+                "result": result,
                 "error": None,
             }
     except HTTPException as exc:
@@ -1016,6 +1244,7 @@ async def health(request: Request):
         "status": "ok",
         "ai_available": ai_inference.is_available(),
         "ai_backend": ai_inference.get_backend(),
+        "ai_cache": ai_inference.get_cache_stats(),
     }
 
 
@@ -1042,6 +1271,7 @@ async def login(request: Request, data: LoginRequest):
             detail="Telegram serveriga ulanib bo'lmadi. 1-2 daqiqadan so'ng qayta urining",
         )
 
+    keep_client = False
     try:
         sent = await asyncio.wait_for(client.send_code_request(data.phone), timeout=10)
         session_string = client.session.save()
@@ -1051,31 +1281,41 @@ async def login(request: Request, data: LoginRequest):
 
         try:
             existing = await database.fetch_one(
-                sessions.select().where(sessions.c.phone == normalized_phone)
+                SELECT_SESSION_BY_PHONE, values={"phone": normalized_phone}
+            )
+            await database.execute(
+                UPDATE_SESSION_CREDENTIALS if existing else INSERT_SESSION,
+                values={
+                    "phone": normalized_phone,
+                    "api_id": data.api_id,
+                    "api_hash": encrypted_hash,
+                    "session_string": encrypted_session,
+                },
             )
-            if existing:
-                await database.execute(
-                    sessions.update()
-                    .where(sessions.c.phone == normalized_phone)
-                    .values(
-                        api_id=data.api_id,
-                        api_hash=encrypted_hash,
-                        session_string=encrypted_session,
-                    )
-                )
-            else:
-                await database.execute(
-                    sessions.insert().values(
-                        phone=normalized_phone,
-                        api_id=data.api_id,
-                        api_hash=encrypted_hash,
-                        session_string=encrypted_session,
-                    )
-                )
         except Exception:
             logger.exception("Database error during /login")
             raise HTTPException(status_code=500, detail="Ma'lumotlar bazasiga saqlashda xatolik")
 
+        async with pending_login_lock:
+            dropped = []
+            old_entry = pending_login_clients.pop(normalized_phone, None)
+            if old_entry is not None:
+                dropped.append(old_entry)
+            # /login is unauthenticated — bound the open connections it can hold
+            while len(pending_login_clients) >= MAX_PENDING_LOGINS:
+                oldest_phone = next(iter(pending_login_clients))
+                dropped.append(pending_login_clients.pop(oldest_phone))
+            pending_login_clients[normalized_phone] = {
+                "client": client,
+                "expires_at": time.time() + PENDING_LOGIN_TTL,
+            }
+        keep_client = True
+        for entry in dropped:
+            try:
+                await entry["client"].disconnect()
+            except Exception:
+                pass
+
         logger.info("SMS code sent to %s", mask_phone(normalized_phone))
         return {"status": "waiting_for_code", "phone_code_hash": sent.phone_code_hash}
 
@@ -1094,11 +1334,12 @@ async def login(request: Request, data: LoginRequest):
         logger.exception("Unexpected error in /login for %s", mask_phone(normalized_phone))
         raise HTTPException(status_code=500, detail="Noma'lum xatolik yuz berdi")
     finally:
-        try:
-            if client.is_connected():
-                await client.disconnect()
-        except Exception as exc:
-            logger.warning("Failed to disconnect client in /login finally: %s", exc)
+        if not keep_client:
+            try:
+                if client.is_connected():
+                    await client.disconnect()
+            except Exception as exc:
+                logger.warning("Failed to disconnect client in /login finally: %s", exc)
 
 
 @app.post("/verify")
@@ -1110,7 +1351,7 @@ async def verify(request: Request, data: VerifyRequest):
     normalized_phone = normalize_phone(data.phone)
 
     user = await database.fetch_one(
-        sessions.select().where(sessions.c.phone == normalized_phone)
+        SELECT_SESSION_BY_PHONE, values={"phone": normalized_phone}
     )
     if not user:
         raise HTTPException(status_code=404, detail="Login qilinmagan — avval /login qiling")
@@ -1137,17 +1378,31 @@ async def verify(request: Request, data: VerifyRequest):
         logger.warning("API credentials mismatch for %s", mask_phone(normalized_phone))
         raise HTTPException(status_code=401, detail="API credentials mos kelmadi")
 
-    client = TelegramClient(
-        StringSession(session_string),
-        user["api_id"],
-        stored_api_hash,
-        timeout=TELETHON_CONNECTION_TIMEOUT,
-        connection_retries=TELETHON_RETRIES,
-        retry_delay=TELETHON_RETRY_DELAY,
-    )
+    async with pending_login_lock:
+        pending = pending_login_clients.pop(normalized_phone, None)
 
-    if not await connect_with_retry(client, normalized_phone):
-        raise HTTPException(status_code=502, detail="Telegram serveriga ulanib bo'lmadi")
+    client: Optional[TelegramClient] = None
+    if pending is not None:
+        if pending["expires_at"] >= time.time() and pending["client"].is_connected():
+            client = pending["client"]
+        else:
+            try:
+                await pending["client"].disconnect()
+            except Exception:
+                pass
+
+    if client is None:
+        client = TelegramClient(
+            StringSession(session_string),
+            user["api_id"],
+            stored_api_hash,
+            timeout=TELETHON_CONNECTION_TIMEOUT,
+            connection_retries=TELETHON_RETRIES,
+            retry_delay=TELETHON_RETRY_DELAY,
+        )
+
+        if not await connect_with_retry(client, normalized_phone):
+            raise HTTPException(status_code=502, detail="Telegram serveriga ulanib bo'lmadi")
 
     try:
         await asyncio.wait_for(
@@ -1202,9 +1457,11 @@ async def verify(request: Request, data: VerifyRequest):
     new_session = client.session.save()
     try:
         await database.execute(
-            sessions.update()
-            .where(sessions.c.phone == normalized_phone)
-            .values(session_string=encrypt_session_string(new_session))
+            UPDATE_SESSION_STRING,
+            values={
+                "phone": normalized_phone,
+                "session_string": encrypt_session_string(new_session),
+            },
         )
     except Exception:
         logger.exception("Database error saving session for %s", mask_phone(normalized_phone))
@@ -1220,6 +1477,7 @@ async def verify(request: Request, data: VerifyRequest):
             except Exception:
                 pass
         active_clients[normalized_phone] = client
+    client_checked_at[normalized_phone] = time.time()
 
     access_token = create_access_token(normalized_phone)
     return {
@@ -1281,9 +1539,11 @@ async def verify_2fa(request: Request, data: TwoFARequest):
     new_session = client.session.save()
     try:
         await database.execute(
-            sessions.update()
-            .where(sessions.c.phone == normalized_phone)
-            .values(session_string=encrypt_session_string(new_session))
+            UPDATE_SESSION_STRING,
+            values={
+                "phone": normalized_phone,
+                "session_string": encrypt_session_string(new_session),
+            },
         )
     except Exception:
         logger.exception("DB error saving 2FA session for %s", mask_phone(normalized_phone))
@@ -1297,6 +1557,7 @@ async def verify_2fa(request: Request, data: TwoFARequest):
             except Exception:
                 pass
         active_clients[normalized_phone] = client
+    client_checked_at[normalized_phone] = time.time()
 
     token = create_access_token(normalized_phone)
     return {
@@ -1319,7 +1580,7 @@ async def get_chats(
         raise HTTPException(status_code=403, detail="Token va so'rov phone mos kelmaydi")
 
     user = await database.fetch_one(
-        sessions.select().where(sessions.c.phone == normalized_phone)
+        SELECT_SESSION_BY_PHONE, values={"phone": normalized_phone}
     )
     if not user:
         raise HTTPException(status_code=401, detail="Noto'g'ri token")
@@ -1351,6 +1612,7 @@ async def get_chats(
         logger.warning("Auth invalidated for %s: %s", mask_phone(normalized_phone), type(exc).__name__)
         async with active_clients_lock:
             active_clients.pop(normalized_phone, None)
+        _forget_client_state(normalized_phone)
         raise HTTPException(
             status_code=401,
             detail="Telegram sessiyasi bekor qilindi. Qayta login qiling",
@@ -1383,19 +1645,21 @@ async def analyze(
         raise HTTPException(status_code=403, detail="Token va so'rov phone mos kelmaydi")
 
     user = await database.fetch_one(
-        sessions.select().where(sessions.c.phone == normalized_phone)
+        SELECT_SESSION_BY_PHONE, values={"phone": normalized_phone}
     )
     if not user:
         raise HTTPException(status_code=401, detail="Noto'g'ri token")
 
     try:
-        return await _do_analyze(data, normalized_phone)
+        # Returning the response directly skips response_model re-validation
+        return ORJSONResponse(await _do_analyze(data, normalized_phone))
     except HTTPException:
         raise
     except (errors.AuthKeyUnregisteredError, errors.UserDeactivatedError) as exc:
         logger.warning("Auth invalidated for %s: %s", mask_phone(normalized_phone), type(exc).__name__)
         async with active_clients_lock:
             active_clients.pop(normalized_phone, None)
+        _forget_client_state(normalized_phone)
         raise HTTPException(
             status_code=401,
             detail="Telegram sessiyasi bekor qilindi. Qayta login qiling",
@@ -1428,7 +1692,7 @@ async def analyze_start(
         raise HTTPException(status_code=403, detail="Token va so'rov phone mos kelmaydi")
 
     user = await database.fetch_one(
-        sessions.select().where(sessions.c.phone == normalized_phone)
+        SELECT_SESSION_BY_PHONE, values={"phone": normalized_phone}
     )
     if not user:
         raise HTTPException(status_code=401, detail="Noto'g'ri token")